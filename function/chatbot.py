@@ -1,5 +1,5 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from llm import get_chat_model
+from langchain_core.messages import HumanMessage, SystemMessage
 from managers.message import MessageManager
 from filter import MentalHealthFilter
 from config import Config
@@ -9,8 +9,10 @@ from managers.events import EventManager
 from managers.crisis import CrisisManager
 from managers.helper import HelperManager
 from firebase_writer import FirebaseWriter
+from executor import run_blocking
 import asyncio
 import logging
+from datetime import datetime
 
 
 class MentalHealthChatbot:
@@ -21,11 +23,9 @@ class MentalHealthChatbot:
         self.firebase_manager = FirebaseManager()
         self.writer = FirebaseWriter()
         self.config = Config()
-        self.llm = ChatGoogleGenerativeAI(
-            model=self.config.model_name,
-            google_api_key=self.config.gemini_api_key,
-            temperature=self.config.temperature,
-            max_tokens=self.config.max_tokens
+        self.llm = get_chat_model(
+            self.config.model_name, self.config.gemini_api_key,
+            temperature=self.config.temperature, max_tokens=self.config.max_tokens
         )
 
         self.message_manager = MessageManager(self.firebase_manager) 
@@ -109,22 +109,57 @@ class MentalHealthChatbot:
 
         Remember: You can be caring and supportive without being aggressive. Save the intense, protective energy for when someone actually needs saving."""
 
+        self.response_guidance = """
+        🎯 RESPONSE GUIDANCE BASED ON URGENCY LEVEL:
+        Level 1-2 (Casual/Mild): Be supportive but relaxed. Don't overreact. Match their energy level.
+        Level 3 (Moderate): Show more concern and support. Ask deeper questions but stay calm.
+        Level 4-5 (Crisis): NOW use your passionate, protective mode. Fight for them!
+
+        🤗 CONVERSATION DEPTH GUIDANCE:
+        - First 1-2 exchanges: Keep it general, build rapport
+        - 3-5 exchanges: Start exploring their situation more
+        - 6+ exchanges with emotional content: NOW you can ask about sleep, food, family, relationships naturally
+
+        💡 FOLLOW-UP QUESTIONS GUIDANCE:
+        Based on the user's emotional state and urgency level, naturally include 1-2 thoughtful follow-up questions in your response that:
+        - Are appropriate for their current emotional state and urgency level
+        - Help them explore their feelings or situation deeper
+        - Show genuine care and interest in their wellbeing
+        - Match the conversation depth (don't ask personal questions too early)
+        - Are contextually relevant to what they've shared
+
+        Remember to:
+        1. Address them by their preferred name (see CURRENT USER STATE in their latest message)
+        2. Reference relevant past conversations
+        3. Match your tone to their ACTUAL emotional state
+        4. Only escalate intensity if urgency level is high
+        5. If there's a proactive greeting above, start with that
+        6. Include natural, caring follow-up questions within your response
+        """
+        
+        # Fixed for the lifetime of the bot, so every request sends an identical prompt prefix
+        self.system_message = SystemMessage(content=f"{self.system_prompt}\n{self.response_guidance}")
+
     async def process_conversation_async(self, email: str, message: str) -> str:
-        """Async conversation processing with parallel blocking calls using asyncio.to_thread.
+        """Async conversation processing with parallel blocking calls on the shared worker pool.
 
         Notes:
-        - Uses asyncio.to_thread to offload blocking CPU/IO work (Firestore + LLM helpers)
+        - Uses run_blocking to offload blocking CPU/IO work (Firestore + LLM helpers)
         - Avoids passing a ThreadPoolExecutor around after shutdown
         - Background tasks (event storage & chat persistence) run fire-and-forget
         - Falls back to sync method on unexpected errors
         """
         try:
+            # One request time, so the conversation read and the prompt agree on "today" and "now"
+            request_time = datetime.now().astimezone()
+            
             # Run initial independent blocking operations concurrently
             (user_profile, topic_filter, emotion_urgency, recent_messages) = await asyncio.gather(
-                asyncio.to_thread(self.firebase_manager.get_user_profile, email),
-                asyncio.to_thread(self.health_filter.filter, message),
-                asyncio.to_thread(self.helper_manager.detect_emotion, message),
-                asyncio.to_thread(self.message_manager.get_conversation, email,self.firebase_manager, None, 20)  # (email, date=None, limit=20)
+                run_blocking(self.firebase_manager.get_user_profile, email),
+                run_blocking(self.health_filter.filter, message),
+                run_blocking(self.helper_manager.detect_emotion, message),
+                run_blocking(self.message_manager.get_conversation, email, self.firebase_manager,
+                             None, 20, now=request_time)  # (email, date=None, limit=20)
             )
 
             emotion, urgency_level = emotion_urgency
@@ -140,7 +175,7 @@ class MentalHealthChatbot:
                 return redirect_response
 
             # Start event extraction (don't await yet unless non-crisis)
-            event_future = asyncio.create_task(asyncio.to_thread(
+            event_future = asyncio.create_task(run_blocking(
                 self.event_manager._extract_events_with_llm, message, email
             ))
 
@@ -175,7 +210,8 @@ class MentalHealthChatbot:
                 user_name=user_name,
                 emotion=emotion,
                 urgency_level=urgency_level,
-                recent_messages=recent_messages
+                recent_messages=recent_messages,
+                now=request_time
             )
             return bot_message
 
@@ -183,55 +219,13 @@ class MentalHealthChatbot:
             logging.error(f"Error in async conversation processing: {e}")
             return self.process_conversation_sync(email, message)
     
-    async def _generate_response_async(self, email: str, message: str, user_name: str, emotion: str, urgency_level: int, recent_messages) -> str:
+    async def _generate_response_async(self, email: str, message: str, user_name: str, emotion: str, urgency_level: int, recent_messages,
+                                       now: datetime) -> str:
         """Generate the LLM response asynchronously (offloading blocking invoke)."""
         try:
-            enhanced_prompt = f"""
-            {self.system_prompt}
-            CONVERSATION CONTEXT:
-            {recent_messages}
-
-            CURRENT USER STATE:
-            - Detected emotion: {emotion}
-            - Urgency level: {urgency_level}/5
-            - User prefers to be called: {user_name}
-
-            🎯 RESPONSE GUIDANCE BASED ON URGENCY LEVEL:
-            Level 1-2 (Casual/Mild): Be supportive but relaxed. Don't overreact. Match their energy level.
-            Level 3 (Moderate): Show more concern and support. Ask deeper questions but stay calm.
-            Level 4-5 (Crisis): NOW use your passionate, protective mode. Fight for them!
-
-            🤗 CONVERSATION DEPTH GUIDANCE:
-            - First 1-2 exchanges: Keep it general, build rapport
-            - 3-5 exchanges: Start exploring their situation more
-            - 6+ exchanges with emotional content: NOW you can ask about sleep, food, family, relationships naturally
-
-            💡 FOLLOW-UP QUESTIONS GUIDANCE:
-            Based on the user's emotional state and urgency level, naturally include 1-2 thoughtful follow-up questions in your response that:
-            - Are appropriate for their current emotional state and urgency level
-            - Help them explore their feelings or situation deeper
-            - Show genuine care and interest in their wellbeing
-            - Match the conversation depth (don't ask personal questions too early)
-            - Are contextually relevant to what they've shared
-
-            Remember to:
-            1. Address them by their preferred name: {user_name}
-            2. Reference relevant past conversations
-            3. Match your tone to their ACTUAL emotional state
-            4. Only escalate intensity if urgency level is high
-            5. If there's a proactive greeting above, start with that
-            6. Include natural, caring follow-up questions within your response
-            """
-            
-            # Build messages for LLM
-            messages = [SystemMessage(content=enhanced_prompt)]
-            if recent_messages:
-                for msg_pair in recent_messages:
-                    messages.append(HumanMessage(content=msg_pair.user_message.content))
-                    messages.append(AIMessage(content=msg_pair.llm_message.content))
-            messages.append(HumanMessage(content=message))
-
-            response = await asyncio.to_thread(self.llm.invoke, messages)
+            messages = self._build_llm_messages(message, user_name, emotion, urgency_level, recent_messages, now)
+
+            response = await run_blocking(self.llm.invoke, messages)
             bot_message = response.content
 
             # Persist interaction (non-blocking for caller)
@@ -245,6 +239,32 @@ class MentalHealthChatbot:
             logging.error(f"Error generating async response: {e}")
             raise
     
+    def _build_llm_messages(self, message: str, user_name: str, emotion: str, urgency_level: int,
+                            recent_messages, now: datetime) -> list:
+        """
+        Build the chat model input so successive turns share the longest possible prefix.
+        
+        The system message is fixed text and the verbatim history follows it; everything that
+        changes per turn (condensed earlier turns, user state, time) goes in the final human message.
+        """
+        turn_prompt = f"""CONVERSATION CONTEXT:
+{self.message_manager.summarize_earlier_turns(recent_messages)}
+
+CURRENT USER STATE:
+- Detected emotion: {emotion}
+- Urgency level: {urgency_level}/5
+- User prefers to be called: {user_name}
+- Current time: {now.isoformat(timespec='minutes')}
+
+USER MESSAGE:
+{message}"""
+        
+        return [
+            self.system_message,
+            *self.message_manager.build_conversation_history(recent_messages),
+            HumanMessage(content=turn_prompt)
+        ]
+    
     def process_conversation(self, email: str, message: str) -> str:
         """Synchronous wrapper for backward compatibility."""
         return asyncio.run(self.process_conversation_async(email, message))
@@ -252,6 +272,7 @@ class MentalHealthChatbot:
     def process_conversation_sync(self, email: str, message: str) -> str:
         """Fallback synchronous conversation processing method with FirebaseWriter."""
         try:
+            request_time = datetime.now().astimezone()
             user_profile = self.firebase_manager.get_user_profile(email)
             logging.info(f"User profile retrieved: {user_profile}")
             user_name = user_profile.name
@@ -276,7 +297,8 @@ class MentalHealthChatbot:
                     self.event_manager.add_event, email, event
                 ))
             
-            recent_messages = self.message_manager.get_conversation(email, self.firebase_manager, limit=20)
+            recent_messages = self.message_manager.get_conversation(email, self.firebase_manager, limit=20,
+                                                                    now=request_time)
             logging.info(f"Recent messages retrieved!")
             
             if urgency_level >= 5:
@@ -290,24 +312,8 @@ class MentalHealthChatbot:
 
                 return crisis_response.content
             
-            enhanced_prompt = f"""
-            {self.system_prompt}
-            CONVERSATION CONTEXT:
-            {recent_messages}
-
-            CURRENT USER STATE:
-            - Detected emotion: {emotion}
-            - Urgency level: {urgency_level}/5
-            - User prefers to be called: {user_name}
-            """
-
-            messages = [SystemMessage(content=enhanced_prompt)]
-            if recent_messages:
-                for msg_pair in recent_messages:
-                    messages.append(HumanMessage(content=msg_pair.user_message.content))
-                    messages.append(AIMessage(content=msg_pair.llm_message.content))
-            
-            messages.append(HumanMessage(content=message))
+            messages = self._build_llm_messages(message, user_name, emotion, urgency_level, recent_messages,
+                                                request_time)
             response = self.llm.invoke(messages)
             bot_message = response.content
 
@@ -1,54 +1,115 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import date
 from config import Config
 from managers.firebase_manager import FirebaseManager
 from managers.message import MessageManager
 from managers.summary import SummaryManager
+from data import MessagePair
 import logging
-from typing import Union, Tuple
+from typing import List, Optional, Union, Tuple
+
+
+# Users whose summaries are generated together in one batched LLM call
+DAILY_TASK_BATCH_SIZE = 50
+
+# Threads for the nightly run's reads and background LLM batch. This is a pool of its own
+# so the run never queues interactive chat work behind it on blocking_executor.
+DAILY_TASK_WORKERS = 8
 
 
 def run_daily_task_for_user(email: str) -> None:
-    
+    run_daily_task_for_users([email])
+
+
+def run_daily_task_for_users(emails: List[str]) -> None:
+    """Summarise each user's last conversation day, generating summaries in batched LLM calls."""
     try:
         config = Config()
         firebase_manager = FirebaseManager()
         message_manager = MessageManager(firebase_manager)
         summary_manager = SummaryManager(config, firebase_manager.db)
     except Exception as e:
-        logging.error(f"Error initializing components for {email}: {e}", exc_info=True)
+        logging.error(f"Error initializing components for daily task: {e}", exc_info=True)
         return 
 
-    try:
-        
-        today_iso = date.today().isoformat()
-        
+    today_iso = date.today().isoformat()
+    # Bounded batches keep only a slice of users' conversations in memory at once.
+    # Each batch's LLM call runs in the background while the next batch is read from Firestore.
+    with ThreadPoolExecutor(max_workers=DAILY_TASK_WORKERS, thread_name_prefix="mindmate-daily") as executor:
+        in_flight = None
+        for start in range(0, len(emails), DAILY_TASK_BATCH_SIZE):
+            pending_emails, conversations = _collect_daily_batch(
+                emails[start:start + DAILY_TASK_BATCH_SIZE], today_iso, executor,
+                firebase_manager, message_manager, summary_manager
+            )
+            if in_flight:
+                _store_daily_batch(*in_flight, today_iso, summary_manager)
+            in_flight = (pending_emails, executor.submit(
+                summary_manager.generate_conversation_summaries_batch, conversations
+            ))
         
+        if in_flight:
+            _store_daily_batch(*in_flight, today_iso, summary_manager)
+
+
+def _collect_daily_batch(emails: List[str], today_iso: str, executor: ThreadPoolExecutor,
+                         firebase_manager: FirebaseManager, message_manager: MessageManager,
+                         summary_manager: SummaryManager) -> Tuple[List[str], List[List[MessagePair]]]:
+    """Read the last conversation day of each user in the batch who still needs today's summary."""
+    # A rerun of the timer on the same day skips users it already summarised
+    already_summarised = summary_manager.daily_summaries_exist(emails, today_iso)
+    emails = [email for email in emails if email not in already_summarised]
+    
+    # Each user's reads are independent and I/O bound, so fetch them concurrently
+    last_day_conversations = executor.map(
+        lambda email: _fetch_last_day_conversation(email, firebase_manager, message_manager),
+        emails
+    )
+    
+    pending_emails = []
+    conversations = []
+    for email, last_day_conversation in zip(emails, last_day_conversations):
+        if last_day_conversation:
+            pending_emails.append(email)
+            conversations.append(last_day_conversation)
+    return pending_emails, conversations
+
+
+def _store_daily_batch(pending_emails: List[str], summaries_future: Future, today_iso: str,
+                       summary_manager: SummaryManager) -> None:
+    """Wait for a batch's summaries and store the ones that were generated."""
+    try:
+        conversation_summaries = summaries_future.result()
+    except Exception as e:
+        logging.error(f"Error generating daily summaries: {e}", exc_info=True)
+        return
+    
+    for email, conversation_summary in zip(pending_emails, conversation_summaries):
+        if conversation_summary:
+            summary_manager.store_daily_summary(
+                email, today_iso, {"summary_text": conversation_summary}
+            )
+
+
+def _fetch_last_day_conversation(email: str, firebase_manager: FirebaseManager,
+                                 message_manager: MessageManager) -> Optional[List[MessagePair]]:
+    """Read the pairs from a user's last conversation day, or None if there are none."""
+    try:
         last_message_time = message_manager.get_last_conversation_time(firebase_manager,email)
         
-        
         if last_message_time:
             
             last_message_date_str = last_message_time.strftime('%Y%m%d')
             
-            
-            last_day_conversation = message_manager.get_conversation(
+            # Materialised here since the batch needs every conversation before the LLM call
+            return list(message_manager.iter_conversation(
                 email, firebase_manager, date=last_message_date_str
-            )
-            
-            
-            if last_day_conversation:
-                conversation_summary = summary_manager.generate_conversation_summary(last_day_conversation)
-                
-                
-                if conversation_summary:
-                    summary_manager.store_daily_summary(
-                        email, today_iso, {"summary_text": conversation_summary}
-                    )
+            ))
 
     except Exception as e:
         logging.error(f"Error executing daily task for {email}: {e}", exc_info=True)
-    
-    
+    return None
+
 
 def send_notification(email: str) -> Union[str, Tuple[str, str]]:
     try:
@@ -0,0 +1,18 @@
+"""
+Shared Worker Pool
+One bounded thread pool for blocking Firestore and LLM calls, reused across requests
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+# Sized for I/O-bound work; bounded so bursts do not open unlimited Firestore connections
+blocking_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="mindmate")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Await a blocking call on the shared pool instead of the event loop's default executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(func, *args, **kwargs))
@@ -1,4 +1,4 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm import get_chat_model
 from langchain_core.messages import HumanMessage, SystemMessage
 from data import MentalHealthTopicFilter
 
@@ -8,10 +8,9 @@ class MentalHealthFilter:
     """Filter to ensure conversations stay focused on mental health topics."""
     
     def __init__(self,config):
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=0.3 
+        self.llm = get_chat_model(
+            config.model_name, config.gemini_api_key,
+            temperature=0.3
         )
     
     def filter(self, message: str) -> MentalHealthTopicFilter:
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from executor import run_blocking
 
 class FirebaseWriter:
     def __init__(self):
@@ -13,7 +14,7 @@ class FirebaseWriter:
         while True:
             func, args, kwargs = await self.queue.get()
             try:
-                await asyncio.to_thread(func, *args, **kwargs)
+                await run_blocking(func, *args, **kwargs)
             except Exception as e:
                 logging.error(f"Firestore write failed: {e}")
             finally:
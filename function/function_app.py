@@ -3,9 +3,10 @@ import logging
 import json
 from datetime import datetime, timezone
 import asyncio
-from daily import run_daily_task_for_user,send_notification
+from daily import run_daily_task_for_users,send_notification
 
 from managers.firebase_manager import FirebaseManager
+from managers.message import MessageManager
 
 from main import android_chat
 
@@ -147,6 +148,80 @@ def notification_handler(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500, mimetype="application/json", headers=CORS_HEADERS
         )
 
+# Users (or, in the orphans phase, conversations) handled per request, so each call
+# finishes well inside the HTTP timeout
+MIGRATION_USERS_PER_REQUEST = 25
+MAX_MIGRATION_USERS_PER_REQUEST = 100
+
+
+@app.route(route="migrate_chat_fields", auth_level=func.AuthLevel.FUNCTION)
+def migrate_chat_fields_handler(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Backfill legacy camelCase chat pair fields, a page at a time.
+    
+    The "users" phase walks users that have a users/{email} document; the "orphans" phase
+    then walks the conversations collection group for users without one. Call again with
+    the returned next.phase and next.start_after as query parameters until next is null.
+    Failed users are listed so they can be retried.
+    """
+    logging.info('Migrate chat fields handler received a request.')
+
+    if req.method == "OPTIONS":
+        return func.HttpResponse("", status_code=204, headers=CORS_HEADERS)
+
+    try:
+        phase = req.params.get('phase', 'users')
+        start_after = req.params.get('start_after')
+        limit = int(req.params.get('limit', MIGRATION_USERS_PER_REQUEST))
+        if phase not in ('users', 'orphans') or not 1 <= limit <= MAX_MIGRATION_USERS_PER_REQUEST:
+            raise ValueError("invalid phase or limit")
+    except ValueError:
+        return func.HttpResponse(
+            json.dumps({"error": f"'phase' must be 'users' or 'orphans' and 'limit' an integer from 1 to {MAX_MIGRATION_USERS_PER_REQUEST}."}),
+            status_code=400, mimetype="application/json", headers=CORS_HEADERS
+        )
+
+    try:
+        firebase_manager = FirebaseManager()
+        message_manager = MessageManager(firebase_manager)
+        
+        if phase == 'users':
+            emails = firebase_manager.list_user_emails(start_after=start_after, limit=limit)
+            if len(emails) == limit:
+                next_page = {"phase": "users", "start_after": emails[-1]}
+            else:
+                next_page = {"phase": "orphans", "start_after": None}
+        else:
+            emails, next_start_after = firebase_manager.list_orphan_user_emails(start_after=start_after, limit=limit)
+            next_page = {"phase": "orphans", "start_after": next_start_after} if next_start_after else None
+
+        migrated = {}
+        failed = []
+        for email in emails:
+            try:
+                migrated[email] = message_manager.migrate_legacy_chat_fields(email)
+            except Exception:
+                failed.append(email)
+
+        return func.HttpResponse(
+            json.dumps({
+                "migrated": migrated,
+                "total": sum(migrated.values()),
+                "failed": failed,
+                "next": next_page
+            }),
+            mimetype="application/json",
+            status_code=200,
+            headers=CORS_HEADERS
+        )
+
+    except Exception as e:
+        logging.error(f"An error occurred in migrate_chat_fields_handler: {e}", exc_info=True)
+        return func.HttpResponse(
+            json.dumps({"error": "An internal server error occurred."}),
+            status_code=500, mimetype="application/json", headers=CORS_HEADERS
+        )
+
 @app.function_name(name="DailyTaskTimer")
 @app.timer_trigger(schedule="0 0 */24 * * *",  
                    arg_name="timer",
@@ -166,11 +241,7 @@ def daily_task_timer(timer: func.TimerRequest) -> None:
             logging.info("No users found in the database. Timer task finished.")
             return
         
-        for email in all_user_emails:
-            try:
-                run_daily_task_for_user(email)
-                logging.info(f"Daily task completed for {email}")
-            except Exception as e:
-                logging.error(f"Error processing daily task for {email}: {e}", exc_info=True)
+        run_daily_task_for_users(all_user_emails)
+        logging.info(f"Daily task completed for {len(all_user_emails)} users")
     except Exception as e:
         logging.error(f"The timer trigger failed with an exception: {e}", exc_info=True)
\ No newline at end of file
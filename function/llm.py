@@ -0,0 +1,24 @@
+"""
+Shared LLM Clients
+Reuses ChatGoogleGenerativeAI clients instead of rebuilding them on every call
+"""
+
+from functools import lru_cache
+from typing import Optional
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name: str, api_key: str, temperature: float,
+                   max_tokens: Optional[int] = None) -> ChatGoogleGenerativeAI:
+    """Return the process-wide chat model client for these settings, creating it on first use."""
+    options = {}
+    if max_tokens is not None:
+        options["max_tokens"] = max_tokens
+    
+    return ChatGoogleGenerativeAI(
+        model=model_name,
+        google_api_key=api_key,
+        temperature=temperature,
+        **options
+    )
@@ -4,7 +4,7 @@ Handles crisis intervention and error handling for the mental health chatbot
 """
 
 import json
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm import get_chat_model
 from langchain_core.messages import SystemMessage, HumanMessage
 from data import LLMMessage
 
@@ -15,10 +15,9 @@ class CrisisManager:
     
     def __init__(self,config):
         """Initialize the CrisisManager with LLM for response generation."""
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=0.7 
+        self.llm = get_chat_model(
+            config.model_name, config.gemini_api_key,
+            temperature=0.7
         )
     
     def handle_crisis_situation(self, user_email: str, message: str,firebase_manager) -> LLMMessage:
@@ -6,7 +6,7 @@ Handles detection, storage, and follow-up of important events in conversations
 import json
 from datetime import date, timedelta, datetime
 from typing import Optional, List
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm import get_chat_model
 from langchain_core.messages import SystemMessage, HumanMessage
 from data import Event
 import hashlib
@@ -19,10 +19,9 @@ class EventManager:
     
     def __init__(self,config,firebase_manager):
         """Initialize the EventManager with LLM for event detection."""
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=0.3 
+        self.llm = get_chat_model(
+            config.model_name, config.gemini_api_key,
+            temperature=0.3
         )
         self.db = firebase_manager.db 
     
@@ -8,15 +8,27 @@ import json
 import base64
 import firebase_admin
 import logging
+import threading
+from typing import Optional, Tuple
+from cachetools import TTLCache
 from firebase_admin import credentials, firestore
-from google.cloud.firestore import FieldFilter
+from google.cloud.firestore import FieldFilter, FieldPath
 from data import UserProfile
 
+
+# Profiles are read on every chat turn and notification and change rarely. The cache is
+# process-wide because the notification and daily paths build a new FirebaseManager per call.
+_PROFILE_CACHE = TTLCache(maxsize=10_000, ttl=300)
+_PROFILE_LOCK = threading.Lock()
+
+
 class FirebaseManager:
     """Firebase manager with email-based user organization using Firestore."""
     
     def __init__(self):
         self.db = None
+        self._profile_cache = _PROFILE_CACHE
+        self._profile_lock = _PROFILE_LOCK
         self.initialize_firebase()
     
     def initialize_firebase(self):
@@ -110,23 +122,73 @@ class FirebaseManager:
         """Get user profile from Firestore using email as document ID."""
         if not self.db:
             raise RuntimeError("Firebase DB not initialized")
+        with self._profile_lock:
+            cached = self._profile_cache.get(email)
+        if cached is not None:
+            return cached
+        
         doc_ref = self.db.collection('users').document(email)
         doc = doc_ref.get()
         if doc.exists:
             data = doc.to_dict()
-            return UserProfile(
+            profile = UserProfile(
                 email=email,
                 name=data.get('name', 'Friend'),
                 timezone=data.get('timezone', 'UTC')
             )
         else:
             # Create a default profile if none exists
-            default_profile = UserProfile(email=email, name='Friend', timezone='UTC')
+            profile = UserProfile(email=email, name='Friend', timezone='UTC')
             doc_ref.set({
-                'name': default_profile.name,
-                'timezone': default_profile.timezone
+                'name': profile.name,
+                'timezone': profile.timezone
             })
-            return default_profile
+        
+        with self._profile_lock:
+            self._profile_cache[email] = profile
+        return profile
+    
+    def list_user_emails(self, start_after: Optional[str] = None, limit: int = 100) -> list:
+        """
+        List one page of user emails that have a users/{email} document, in email order.
+        
+        The page is cut on the server and only document names are returned, so each call
+        costs at most `limit` reads however many users there are.
+        """
+        if not self.db:
+            raise RuntimeError("Firebase DB not initialized")
+        users_ref = self.db.collection('users')
+        query = users_ref.select([]).order_by(FieldPath.document_id())
+        if start_after is not None:
+            query = query.where(filter=FieldFilter(FieldPath.document_id(), '>', users_ref.document(start_after)))
+        return [doc.id for doc in query.limit(limit).stream()]
+    
+    def list_orphan_user_emails(self, start_after: Optional[str] = None,
+                                limit: int = 100) -> Tuple[list, Optional[str]]:
+        """
+        Find users who have conversations but no users/{email} document, one page at a time.
+        
+        Pages through the conversations collection group by document path, so `limit` counts
+        conversations scanned, not users found.
+        
+        Returns:
+            Tuple of (orphan emails in this page, path to pass as start_after for the next page,
+            or None once every conversation has been scanned).
+        """
+        if not self.db:
+            raise RuntimeError("Firebase DB not initialized")
+        query = self.db.collection_group('conversations').select([]).order_by(FieldPath.document_id())
+        if start_after is not None:
+            query = query.where(filter=FieldFilter(FieldPath.document_id(), '>', self.db.document(start_after)))
+        page = list(query.limit(limit).stream())
+        
+        # Conversation paths sort by user, so parents come out grouped and in order
+        parent_refs = list({doc.reference.parent.parent.path: doc.reference.parent.parent for doc in page}.values())
+        existing = {doc.id for doc in self.db.get_all(parent_refs, field_paths=[]) if doc.exists} if parent_refs else set()
+        orphans = [ref.id for ref in parent_refs if ref.id not in existing]
+        
+        next_start_after = page[-1].reference.path if len(page) == limit else None
+        return orphans, next_start_after
     
     def get_all_user_emails(self) -> list:
         """Retrieve all user emails from Firestore."""
@@ -4,7 +4,7 @@ Contains utility functions for generating follow-up questions and suggestions
 """
 
 from typing import List, Dict, Tuple
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm import get_chat_model
 from langchain_core.messages import SystemMessage, HumanMessage
 
 
@@ -14,11 +14,9 @@ class HelperManager:
     
     def __init__(self,config):
         """Initialize the HelperManager with LLM for response generation."""
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=config.temperature,
-            max_tokens=config.max_tokens
+        self.llm = get_chat_model(
+            config.model_name, config.gemini_api_key,
+            temperature=config.temperature, max_tokens=config.max_tokens
         )
 
     def detect_emotion(self, message: str) -> Tuple[str, int]:
@@ -104,11 +102,10 @@ class HelperManager:
         recent_messages = message_manager.get_conversation(email, firebase_manager, date=None, limit=10)
         
         # Build conversation history for context
-        conversation_context = ""
-        if recent_messages:
-            for msg_pair in recent_messages[-5:]:  # Last 5 messages for context
-                conversation_context += f"User: {msg_pair.user_message.content}\n"
-                conversation_context += f"Assistant: {msg_pair.llm_message.content}\n"
+        conversation_context = "".join(
+            f"User: {msg_pair.user_message.content}\nAssistant: {msg_pair.llm_message.content}\n"
+            for msg_pair in (recent_messages or [])[-5:]  # Last 5 messages for context
+        )
 
         system_prompt = f"""You are a caring mental health companion. Generate practical suggestions for someone based on their emotional state and conversation context.
 
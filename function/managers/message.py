@@ -1,33 +1,120 @@
-from typing import List, Dict, Optional
-from datetime import datetime, timezone, date, timedelta
-from firebase_admin import firestore
-from data import ConversationMemory, MessagePair, UserProfile, UserMessage, LLMMessage
-from datetime import timezone
+from typing import Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
+from data import MessagePair, UserMessage, LLMMessage
+from llm import get_chat_model
+from executor import blocking_executor
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
 from google.cloud import firestore as fbs
 from google.cloud.firestore_v1 import Increment
+from cachetools import TTLCache
+import threading
 import logging
 
+logger = logging.getLogger(__name__)
+
+# Fields read when parsing chat pairs; projecting them keeps query payloads small.
+# The camelCase names stay until migrate_legacy_chat_fields has run for every user.
+CHAT_PAIR_FIELDS = [
+    'user', 'model', 'timestamp', 'emotion_detected', 'urgency_level',
+    'suggestions', 'follow_up_questions', 'emotionDetected', 'urgencyLevel'
+]
+
+# Legacy camelCase chat pair fields and the snake_case names that replaced them
+LEGACY_CHAT_FIELDS = {
+    'emotionDetected': 'emotion_detected',
+    'urgencyLevel': 'urgency_level'
+}
+
+# Chat pairs fetched per query when reading a whole day
+CHAT_PAGE_SIZE = 50
+
+# Most recent pairs considered for the notification prompt, and the rough token
+# budget (~4 characters per token) for the ones quoted verbatim
+NOTIFICATION_CONTEXT_PAIRS = 5
+NOTIFICATION_VERBATIM_TOKEN_BUDGET = 400
+
+# Most recent messages (user + model) sent to the LLM verbatim; older turns are condensed
+MAX_HISTORY_MESSAGES = 10
+
+# Distinguishes "not cached" from a cached None (user with no conversations yet)
+_NOT_CACHED = object()
+
+# Process-wide caches, shared by every MessageManager so per-request managers
+# (notifications, daily tasks) reuse reads made earlier in the same worker.
+# Recent conversation reads keyed by (email, date), each holding a {limit: pairs} dict so
+# a user's day can be looked up or dropped without scanning every entry. The TTL runs from
+# the first read of the day's entry, so nothing in it is older than 60s.
+_RECENT_CACHE = TTLCache(maxsize=1024, ttl=60)
+# Last message time per email, refreshed locally whenever a chat pair is written
+_LAST_TIME_CACHE = TTLCache(maxsize=10000, ttl=300)
+_CACHE_LOCK = threading.Lock()
+
+
+# Notification prompts are fixed apart from a few slots, so they are built once at import
+_NOTIFICATION_SYSTEM_MESSAGE = SystemMessage(content="""You are a formal but caring big brother. Generate a SHORT notification (maximum 15 words) in the FORMAL BIG BROTHER + 2 QUESTIONS + CONCERN style.
+
+            REQUIRED STYLE FORMAT:
+            "[Name], [first concern question]? [second supportive question]??"
+
+            GUIDELINES:
+            - Always ask 2 short questions, both ending with "?" (second one with "??").
+            - Keep total length under 15 words.
+            - Maintain a formal yet caring big brother tone.
+            - Show genuine concern based on their situation.
+
+            QUESTION STARTERS: "How was", "Feeling", "Still", "Is", "Did", "Was", "Are you"
+            TONE: Warm, supportive, checking in with care.
+
+            EXAMPLES:
+            - "Alex, how was class today? Feeling better now??"
+            - "Sarah, was chemistry easier? Less stress this time??"
+            - "Emma, was your day kind? Heart calmer this evening??"
+            """)
+
+_NOTIFICATION_HUMAN_TEMPLATE = """Analyze this conversation with {name} and create a FORMAL BIG BROTHER notification:
+
+            USER SITUATION: {situation}
+
+            RECENT CONVERSATION:
+            [SUMMARY]
+            {summary}
+            [RECENT]
+            {recent}
+
+            TASK: Create a notification using this EXACT FORMAT:
+            "[Name], [first concern question]? [second supportive question]??"
+
+            The notification must be under 15 words, show concern, and match their current situation.
+            """
+
+
+def _today_str(now: Optional[datetime] = None) -> str:
+    """Return the YYYYMMDD conversation date for `now` (local time by default)."""
+    return (now or datetime.now()).strftime('%Y%m%d')
+
+
 class MessageManager:
     """Manages conversation memory, user profiles, and chat history using Firebase."""
     
     def __init__(self,firebase_manager):
-        self.conversations: Dict[str, ConversationMemory] = {}
-        self.user_profiles: Dict[str, UserProfile] = {}
         self.db = firebase_manager.db
+        self.firebase_manager = firebase_manager
+        self._recent_cache = _RECENT_CACHE
+        self._last_time_cache = _LAST_TIME_CACHE
+        self._cache_lock = _CACHE_LOCK
     
     def add_chat_pair(self, email: str, user_message: str, model_response: str, 
                     emotion_detected: str = None, urgency_level: int = 1):
         """Add a chat pair (user + model response) to Firestore."""
         if not self.db:
-            logging.error(f"ERROR: Firestore DB not initialized.")
+            logger.error("Firestore DB not initialized.")
             return
         
         try:
-            logging.info(f"Adding chat pair for {email}")
+            logger.info("Adding chat pair for %s", email)
             now = datetime.now()
-            conversation_id = f"conv_{now.strftime('%Y%m%d')}"
+            today_str = _today_str(now)
+            conversation_id = f"conv_{today_str}"
             
             chat_pair_data = {
                 "user": user_message,
@@ -39,32 +126,86 @@ class MessageManager:
                 chat_pair_data["emotion_detected"] = emotion_detected
             
             # Reference to today's conversation doc
-            conv_doc_ref = (
-                self.db.collection("users")
-                .document(email)
-                .collection("conversations")
-                .document(conversation_id)
-            )
-            logging.info(f"Conversation document ref: {conv_doc_ref.path}")
+            user_doc_ref = self.db.collection("users").document(email)
+            conv_doc_ref = user_doc_ref.collection("conversations").document(conversation_id)
+            logger.info("Conversation document ref: %s", conv_doc_ref.path)
 
-            # Ensure conversation doc exists & update counters
-            conv_doc_ref.set({
-                "startDate": now.strftime("%Y-%m-%d"),
+            conversation_data = {
                 "chatPairCount": Increment(1),
                 "messageCount": Increment(2),   # user + model
                 "lastChatAt": fbs.SERVER_TIMESTAMP,
                 "lastMessageAt": fbs.SERVER_TIMESTAMP
-            }, merge=True)
-
-            # Add chat pair into subcollection
-            conv_doc_ref.collection("chat").add(chat_pair_data)
+            }
+            # startDate never changes, so only the day's first pair writes it
+            if self._is_first_chat_of_day(email, self.firebase_manager, now):
+                conversation_data["startDate"] = now.strftime("%Y-%m-%d")
+            
+            # Write the chat pair and update the conversation counters in one atomic commit
+            batch = self.db.batch()
+            batch.set(conv_doc_ref.collection("chat").document(), chat_pair_data)
+            batch.set(conv_doc_ref, conversation_data, merge=True)
+            # Denormalized onto the user doc so the last message time is a single read
+            batch.set(user_doc_ref, {"lastMessageAt": fbs.SERVER_TIMESTAMP}, merge=True)
+            batch.commit()
 
-            logging.info(f"SUCCESS: Added chat pair to {email}'s conversation")
+            self._invalidate_recent_cache(email, today_str)
+            with self._cache_lock:
+                self._last_time_cache[email] = datetime.now(timezone.utc)
+            logger.info("Added chat pair to %s's conversation", email)
 
-        except Exception as e:
-            logging.error(f"ERROR: Error adding chat pair: {e}")
+        except Exception:
+            logger.exception("Error adding chat pair")
     
-    def get_conversation(self, email: str, firebase_manager,date: Optional[str] = None, limit: Optional[int] = None) -> List[MessagePair]:
+    def migrate_legacy_chat_fields(self, email: str) -> int:
+        """
+        Copy legacy camelCase chat pair fields to their snake_case names for one user.
+        
+        Returns:
+            int: Number of chat pairs updated.
+        """
+        if not self.db:
+            return 0
+        
+        updated = 0
+        try:
+            conversations_ref = self.db.collection('users').document(email).collection('conversations')
+            fields = list(LEGACY_CHAT_FIELDS) + list(LEGACY_CHAT_FIELDS.values())
+            batch = self.db.batch()
+            pending = 0
+            
+            for conv_ref in conversations_ref.list_documents():
+                for chat_doc in conv_ref.collection('chat').select(fields).stream():
+                    pair_data = chat_doc.to_dict()
+                    updates = {
+                        new_field: pair_data[old_field]
+                        for old_field, new_field in LEGACY_CHAT_FIELDS.items()
+                        if old_field in pair_data and new_field not in pair_data
+                    }
+                    if not updates:
+                        continue
+                    
+                    batch.update(chat_doc.reference, updates)
+                    pending += 1
+                    updated += 1
+                    # Firestore batches are limited to 500 writes
+                    if pending == 500:
+                        batch.commit()
+                        batch = self.db.batch()
+                        pending = 0
+            
+            if pending:
+                batch.commit()
+            logger.info("Migrated %d legacy chat pairs for %s", updated, email)
+            
+        except Exception:
+            # Re-raised so the caller can retry this user instead of treating it as migrated
+            logger.exception("Error migrating legacy chat fields for %s", email)
+            raise
+        
+        return updated
+    
+    def get_conversation(self, email: str, firebase_manager,date: Optional[str] = None, limit: Optional[int] = None,
+                         now: Optional[datetime] = None) -> List[MessagePair]:
         """
         Get conversation messages for a specific date with optional limit.
         If no messages are available for the specified date (or today), falls back to the last conversation day.
@@ -73,6 +214,7 @@ class MessageManager:
             email: User's email address
             date: Date string in YYYYMMDD format. If None, uses today's date. If no messages are available for the specified date (or today), falls back to the last conversation day.
             limit: Maximum number of messages to return. If None, returns all messages. When limit is specified, returns the most recent messages first.
+            now: Request time used to resolve today's date. If None, uses the current time.
         
         Returns:
             List[MessagePair]: List of message pairs ordered chronologically (oldest first) unless limited, then most recent messages are returned.
@@ -82,139 +224,325 @@ class MessageManager:
         
         # Use today's date if no date provided
         if date is None:
-            date = datetime.now().strftime('%Y%m%d')
+            date = _today_str(now)
+        
+        cache_key = (email, date)
+        with self._cache_lock:
+            cached = self._recent_cache.get(cache_key, {}).get(limit)
+        if cached is not None:
+            return cached
         
         try:
+            conversations_ref = firebase_manager.db.collection('users').document(email).collection('conversations')
             conversation_id = f"conv_{date}"
-            doc_ref = firebase_manager.db.collection('users').document(email).collection('conversations').document(conversation_id)
-            doc = doc_ref.get()
-            
-            # If no conversation exists for the specified date, try to get last conversation
-            if not doc.exists:
-                last_conversation_time = self.get_last_conversation_time(email)
-                if last_conversation_time:
-                    last_date = last_conversation_time.strftime('%Y%m%d')
-                    conversation_id = f"conv_{last_date}"
-                    doc_ref = firebase_manager.db.collection('users').document(email).collection('conversations').document(conversation_id)
-                    doc = doc_ref.get()
-                    
-                    if not doc.exists:
-                        return []
-                else:
-                    return []
-            
-            chat_ref = doc_ref.collection('chat')
-            
-            # Apply limit if specified (get most recent messages)
-            if limit is not None:
-                query = chat_ref.order_by('timestamp', direction='DESCENDING').limit(limit)
-                pairs = list(query.stream())
-                # Reverse to get chronological order (oldest first)
-                pairs.reverse()
-            else:
-                # Get all messages in chronological order
-                query = chat_ref.order_by('timestamp')
-                pairs = list(query.stream())
             
-            message_pairs = []
+            # Subcollection queries succeed even when the parent doc is absent,
+            # so an empty result doubles as the existence check.
+            pairs = self._get_chat_docs(conversations_ref.document(conversation_id).collection('chat'), limit)
             
-            for pair in pairs:
-                pair_data = pair.to_dict()
+            # If no messages exist for the specified date, try to get last conversation
+            if not pairs:
+                last_conversation_time = self.get_last_conversation_time(firebase_manager, email)
+                if not last_conversation_time:
+                    return []
                 
-                try:
-                    # Create UserMessage
-                    user_message = UserMessage(
-                        content=pair_data.get('user', ''),
-                        emotion_detected=pair_data.get('emotion_detected') or pair_data.get('emotionDetected'),
-                        urgency_level=pair_data.get('urgency_level') or pair_data.get('urgencyLevel', 1)
-                    )
-                    
-                    # Create LLMMessage  
-                    llm_message = LLMMessage(
-                        content=pair_data.get('model', ''),
-                        suggestions=pair_data.get('suggestions', []),
-                        follow_up_questions=pair_data.get('follow_up_questions', [])
-                    )
-                    
-                    # Create MessagePair
-                    message_pair = MessagePair(
-                        user_message=user_message,
-                        llm_message=llm_message,
-                        timestamp=pair_data.get('timestamp', datetime.now()),
-                        conversation_id=conversation_id
-                    )
-                    
-                    message_pairs.append(message_pair)
-                    
-                except Exception as e:
-                    logging.warning(f"Could not parse message pair: {e}")
-                    continue
+                last_date = last_conversation_time.strftime('%Y%m%d')
+                if last_date == date:
+                    return []
+                conversation_id = f"conv_{last_date}"
+                pairs = self._get_chat_docs(conversations_ref.document(conversation_id).collection('chat'), limit)
+            
+            message_pairs = self._parse_pairs(pairs, conversation_id)
             
+            with self._cache_lock:
+                day_entry = self._recent_cache.get(cache_key)
+                if day_entry is None:
+                    day_entry = self._recent_cache[cache_key] = {}
+                day_entry[limit] = message_pairs
             return message_pairs
             
-        except Exception as e:
-            logging.error(f"Error getting conversation: {e}")
+        except Exception:
+            logger.exception("Error getting conversation")
             return []
 
+    def iter_conversation(self, email: str, firebase_manager, date: str,
+                          page_size: int = CHAT_PAGE_SIZE) -> Iterator[MessagePair]:
+        """
+        Yield a day's message pairs in chronological order, fetching one page at a time.
+        
+        The next page is only requested once the consumer has used up the current one,
+        so long days are never held in memory all at once. A failed page read raises rather
+        than ending the iteration early, so callers never mistake a partial day for a whole one.
+        """
+        if not firebase_manager.db:
+            return
+        
+        cursor = None
+        while True:
+            page, cursor = self._read_conversation_page(email, firebase_manager, date, page_size, cursor)
+            yield from page
+            if cursor is None:
+                return
+
+    def _read_conversation_page(self, email: str, firebase_manager, date: str, page_size: int,
+                                cursor=None) -> Tuple[List[MessagePair], Optional[object]]:
+        """
+        Read and parse one page of a day's conversation, letting Firestore errors propagate.
+        
+        Args:
+            email: User's email address
+            date: Date string in YYYYMMDD format.
+            page_size: Maximum number of message pairs in the page.
+            cursor: Value returned as next_cursor by the previous call, or None for the first page.
+        
+        Returns:
+            Tuple of (message pairs, next_cursor). next_cursor is None once the last page is reached.
+        """
+        conversation_id = f"conv_{date}"
+        chat_ref = (
+            firebase_manager.db.collection('users')
+            .document(email)
+            .collection('conversations')
+            .document(conversation_id)
+            .collection('chat')
+        )
+        page, next_cursor = self._get_chat_page(chat_ref, page_size, cursor)
+        return self._parse_pairs(page, conversation_id), next_cursor
+
+    def _parse_pairs(self, pairs: list, conversation_id: str) -> List[MessagePair]:
+        """Convert chat pair snapshots into MessagePair objects, skipping malformed ones."""
+        message_pairs = []
+        # Pairs missing a timestamp all share one fallback instead of a clock read per row
+        fallback_timestamp = datetime.now()
+        
+        for pair in pairs:
+            try:
+                message_pairs.append(self._row_to_pair(pair.to_dict(), conversation_id, fallback_timestamp))
+            except Exception as e:
+                logger.warning("Could not parse message pair: %s", e)
+                continue
+        
+        return message_pairs
+
+    def _row_to_pair(self, pair_data: dict, conversation_id: Optional[str] = None,
+                     fallback_timestamp: Optional[datetime] = None) -> MessagePair:
+        """Build a MessagePair from a chat pair document's fields.
+        
+        Stored pairs were validated when they were written, so rows that pass a cheap shape
+        check are built with model_construct to skip re-validation on every read. Anything
+        else goes through full validation, which raises for rows that are really malformed.
+        """
+        get = pair_data.get
+        timestamp = get('timestamp')
+        if timestamp is None:
+            timestamp = fallback_timestamp or datetime.now()
+        # Pairs not yet backfilled by migrate_legacy_chat_fields only have the camelCase keys
+        emotion_detected = get('emotion_detected')
+        if emotion_detected is None:
+            emotion_detected = get('emotionDetected')
+        urgency_level = get('urgency_level')
+        if urgency_level is None:
+            urgency_level = get('urgencyLevel', 1)
+        user_content = get('user', '')
+        llm_content = get('model', '')
+        suggestions = get('suggestions', [])
+        follow_up_questions = get('follow_up_questions', [])
+        
+        if not (isinstance(user_content, str) and isinstance(llm_content, str)
+                and (emotion_detected is None or isinstance(emotion_detected, str))
+                and type(urgency_level) is int and 1 <= urgency_level <= 5
+                and isinstance(suggestions, list) and isinstance(follow_up_questions, list)):
+            return MessagePair.model_validate({
+                'user_message': {
+                    'content': user_content,
+                    'emotion_detected': emotion_detected,
+                    'urgency_level': urgency_level
+                },
+                'llm_message': {
+                    'content': llm_content,
+                    'suggestions': suggestions,
+                    'follow_up_questions': follow_up_questions
+                },
+                'timestamp': timestamp,
+                'conversation_id': conversation_id
+            })
+        
+        user_message = UserMessage.model_construct(
+            content=user_content,
+            emotion_detected=emotion_detected,
+            urgency_level=urgency_level
+        )
+        llm_message = LLMMessage.model_construct(
+            content=llm_content,
+            suggestions=suggestions,
+            follow_up_questions=follow_up_questions
+        )
+        return MessagePair.model_construct(
+            user_message=user_message,
+            llm_message=llm_message,
+            timestamp=timestamp,
+            conversation_id=conversation_id
+        )
+
+    def _invalidate_recent_cache(self, email: str, date: str):
+        """Drop cached conversation reads for a user's day so the next read sees new pairs."""
+        with self._cache_lock:
+            self._recent_cache.pop((email, date), None)
+
+    def _get_chat_docs(self, chat_ref, limit: Optional[int] = None) -> list:
+        """Fetch chat pair snapshots in chronological order, keeping only the most recent `limit` if given."""
+        chat_query = chat_ref.select(CHAT_PAIR_FIELDS)
+        if limit is not None:
+            query = chat_query.order_by('timestamp', direction='DESCENDING').limit(limit)
+            pairs = list(query.stream())
+            # Reverse to get chronological order (oldest first)
+            pairs.reverse()
+            return pairs
+        
+        # Get all messages in chronological order, one page at a time
+        pairs = []
+        cursor = None
+        while True:
+            page, cursor = self._get_chat_page(chat_ref, CHAT_PAGE_SIZE, cursor)
+            pairs.extend(page)
+            if cursor is None:
+                return pairs
+
+    def _get_chat_page(self, chat_ref, page_size: int, cursor=None) -> Tuple[list, Optional[object]]:
+        """Fetch one chronological page of chat pair snapshots and the cursor for the next page."""
+        query = chat_ref.select(CHAT_PAIR_FIELDS).order_by('timestamp').limit(page_size)
+        if cursor is not None:
+            query = query.start_after(cursor)
+        page = list(query.stream())
+        next_cursor = page[-1] if len(page) == page_size else None
+        return page, next_cursor
+
+    def build_conversation_history(self, message_pairs: List[MessagePair]) -> list:
+        """Convert the most recent message pairs into alternating LangChain human/AI messages."""
+        recent_pairs = (message_pairs or [])[-(MAX_HISTORY_MESSAGES // 2):]
+        return [
+            message
+            for pair in recent_pairs
+            for message in (HumanMessage(content=pair.user_message.content),
+                            AIMessage(content=pair.llm_message.content))
+        ]
+
+    def summarize_earlier_turns(self, message_pairs: List[MessagePair]) -> str:
+        """Condense pairs older than the verbatim history window into one line each."""
+        earlier_pairs = (message_pairs or [])[:-(MAX_HISTORY_MESSAGES // 2)]
+        if not earlier_pairs:
+            return "No earlier turns."
+        return "Earlier turns summary:\n" + "\n".join(
+            f"[{pair.timestamp.isoformat(timespec='minutes')}] "
+            f"emotion: {pair.user_message.emotion_detected or 'unknown'}, "
+            f"urgency: {pair.user_message.urgency_level}/5"
+            for pair in earlier_pairs
+        )
+
     def get_last_conversation_time(self, firebase_manager,email: str) -> Optional[datetime]:
         """Get the timestamp of the user's last message from any conversation date."""
         if not firebase_manager.db:
             return None
         
+        with self._cache_lock:
+            cached = self._last_time_cache.get(email, _NOT_CACHED)
+        if cached is not _NOT_CACHED:
+            return cached
+        
         try:
-            conversations_ref = firebase_manager.db.collection('users').document(email).collection('conversations')
-            conversations = conversations_ref.stream()
-            latest_timestamp = None
+            user_ref = firebase_manager.db.collection('users').document(email)
+            user_doc = user_ref.get(field_paths=['lastMessageAt'])
+            latest_timestamp = (user_doc.to_dict() or {}).get('lastMessageAt')
             
-            for doc in conversations:
-                conv_id = doc.id
-                if conv_id.startswith('conv_'):
-                    try:
-                        chat_ref = conversations_ref.document(conv_id).collection('chat')
+            if latest_timestamp is None:
+                # Users who have not chatted since lastMessageAt was denormalized: find the latest day.
+                # Conversation IDs are conv_YYYYMMDD, so the greatest document name is the latest day.
+                latest_query = user_ref.collection('conversations').order_by('__name__', direction='DESCENDING').limit(1)
+                latest_conv = next(latest_query.select(['lastMessageAt']).stream(), None)
+                if latest_conv is not None and latest_conv.id.startswith('conv_'):
+                    latest_timestamp = latest_conv.to_dict().get('lastMessageAt')
+                    if latest_timestamp is None:
+                        # Older conversation docs may lack lastMessageAt; read the newest chat pair instead
+                        chat_ref = latest_conv.reference.collection('chat')
                         last_message_query = chat_ref.order_by('timestamp', direction='DESCENDING').limit(1)
-                        last_messages = last_message_query.stream()
-                        
-                        for message_doc in last_messages:
-                            message_data = message_doc.to_dict()
-                            timestamp = message_data.get('timestamp')
-                            if timestamp:
-                                if latest_timestamp is None or timestamp > latest_timestamp:
-                                    latest_timestamp = timestamp
-                                    
-                    except Exception as conv_error:
-                        logging.warning(f"Error processing conversation {conv_id}: {conv_error}")
-                        continue
+                        last_message = next(last_message_query.select(['timestamp']).stream(), None)
+                        if last_message is not None:
+                            latest_timestamp = last_message.to_dict().get('timestamp')
+            
+            with self._cache_lock:
+                self._last_time_cache[email] = latest_timestamp
             return latest_timestamp
             
-        except Exception as e:
-            logging.error(f"Error getting last conversation time: {e}")
+        except Exception:
+            logger.exception("Error getting last conversation time")
             return None
     
-    def _is_first_chat_of_day(self, email: str) -> bool:
+    def _get_latest_summary_text(self, email: str) -> Optional[str]:
+        """Return the most recently stored daily summary text for a user, if any."""
+        if not self.db:
+            return None
+        
+        try:
+            # Summary IDs are daily_YYYY-MM-DD, so the greatest document name is the newest summary
+            summaries_ref = self.db.collection('users').document(email).collection('summaries')
+            query = summaries_ref.order_by('__name__', direction='DESCENDING').limit(1).select(['summary_text'])
+            latest = next(query.stream(), None)
+            return latest.to_dict().get('summary_text') if latest is not None else None
+        except Exception:
+            logger.exception("Error getting latest summary")
+            return None
+
+    def _build_verbatim_context(self, message_pairs: List[MessagePair], token_budget: int) -> str:
+        """Quote the newest pairs verbatim, oldest first, stopping once the token budget is used."""
+        # ~4 characters per token; a single pair longer than the whole budget is clipped to it
+        max_chars = token_budget * 4
+        lines = []
+        used_tokens = 0
+        for pair in reversed(message_pairs):
+            line = f"User: {pair.user_message.content}\nAssistant: {pair.llm_message.content}"
+            if len(line) > max_chars:
+                line = line[:max_chars - 4] + " ..."
+            used_tokens += len(line) // 4
+            if lines and used_tokens > token_budget:
+                break
+            lines.append(line)
+        return "\n".join(reversed(lines))
+
+    def _is_first_chat_of_day(self, email: str, firebase_manager, now: Optional[datetime] = None) -> bool:
         """
         Returns True if this is the user's first chat of the day, False otherwise.
         """
         try:
-            today_str = datetime.now().strftime('%Y%m%d')
+            today_str = _today_str(now)
             conversation_id = f"conv_{today_str}"
-            doc_ref = self.db.collection('users').document(email).collection('conversations').document(conversation_id)
-            doc = doc_ref.get()
-            # If the conversation document does not exist, it's the first chat of the day
-            return not doc.exists
-        except Exception as e:
-            logging.error(f"Error checking first chat of day: {e}")
-            return False
+            
+            # A recent read of today's conversation already answers this without another RPC
+            with self._cache_lock:
+                cached = next(iter(self._recent_cache.get((email, today_str), {}).values()), None)
+            if cached is not None:
+                return not any(pair.conversation_id == conversation_id for pair in cached)
+            
+            # Otherwise compare against the denormalized (and cached) last message time
+            last_message_time = self.get_last_conversation_time(firebase_manager, email)
+            return last_message_time is None or _today_str(last_message_time.astimezone()) != today_str
+        except Exception:
+            logger.exception("Error checking first chat of day")
+            # Assume a new day so callers that write per-day fields still write them
+            return True
 
     def generate_notification_text(self, email: str, config, firebase_manager) -> str:
         """Generate a short, comforting notification text based on recent activity and context."""
+        # The profile, last message time and stored summary are independent reads, so fetch them concurrently
+        last_time_future = blocking_executor.submit(self.get_last_conversation_time, firebase_manager, email)
+        summary_future = blocking_executor.submit(self._get_latest_summary_text, email)
+        user_profile = firebase_manager.get_user_profile(email)
+        user_name = user_profile.name
+        
         try:
             now = datetime.now(timezone.utc)
-            today = now.strftime('%Y%m%d')
-            yesterday = (now - timedelta(days=1)).strftime('%Y%m%d')
+            recent_messages = []
             
-            user_profile = firebase_manager.get_user_profile(email)
-            user_name = user_profile.name
-            last_message_time = self.get_last_conversation_time(firebase_manager,email)
+            last_message_time = last_time_future.result()
             
             if last_message_time:
                 try:
@@ -230,7 +558,8 @@ class MessageManager:
                     last_message_date_str = last_message_date.strftime('%Y%m%d')
                     
                     # Get conversation from the actual date of last message
-                    recent_messages = self.get_conversation(email, firebase_manager,last_message_date_str)
+                    recent_messages = self.get_conversation(email, firebase_manager, last_message_date_str,
+                                                            limit=NOTIFICATION_CONTEXT_PAIRS)
                     
                     if recent_messages and len(recent_messages) > 0:
                         if hours_since_last < 24:
@@ -243,62 +572,25 @@ class MessageManager:
                         conversation_context = f"Hey {user_name}, Missing you. Are you feeling okay??"
                         
                 except Exception as tz_error:
-                    logging.error(f"Timezone handling error: {tz_error}")
+                    logger.error("Timezone handling error: %s", tz_error)
                     conversation_context = f"Hey {user_name}, Missing you. Are you feeling okay??"
             else:
                 # No messages found at all
                 return f"Hey {user_name}, Missing you. Are you feeling okay??"
             
             # Build context from recent messages
-            context_text = ""
-            if 'recent_messages' in locals():
-                for pair in recent_messages:
-                    context_text += f"User: {pair.user_message.content}\n"
-                    context_text += f"Assistant: {pair.llm_message.content}\n"
+            context_text = self._build_verbatim_context(recent_messages, NOTIFICATION_VERBATIM_TOKEN_BUDGET)
+            summary_text = summary_future.result()
             
-            llm = ChatGoogleGenerativeAI(
-                model=config.model_name,
-                google_api_key=config.gemini_api_key,
-                temperature=0.8
-            )
+            llm = get_chat_model(config.model_name, config.gemini_api_key, temperature=0.8)
             
-            system_prompt = """You are a formal but caring big brother. Generate a SHORT notification (maximum 15 words) in the FORMAL BIG BROTHER + 2 QUESTIONS + CONCERN style.
-
-            REQUIRED STYLE FORMAT:
-            "[Name], [first concern question]? [second supportive question]??"
-
-            GUIDELINES:
-            - Always ask 2 short questions, both ending with "?" (second one with "??").
-            - Keep total length under 15 words.
-            - Maintain a formal yet caring big brother tone.
-            - Show genuine concern based on their situation.
-
-            QUESTION STARTERS: "How was", "Feeling", "Still", "Is", "Did", "Was", "Are you"
-            TONE: Warm, supportive, checking in with care.
-
-            EXAMPLES:
-            - "Alex, how was class today? Feeling better now??"
-            - "Sarah, was chemistry easier? Less stress this time??"
-            - "Emma, was your day kind? Heart calmer this evening??"
-            """
-            
-            human_prompt = f"""Analyze this conversation with {user_name} and create a FORMAL BIG BROTHER notification:
-
-            USER SITUATION: {conversation_context if 'conversation_context' in locals() else "User has been away for several hours"}
-
-            RECENT CONVERSATION:
-            {context_text if context_text else "No recent conversation available"}
-
-            TASK: Create a notification using this EXACT FORMAT:
-            "[Name], [first concern question]? [second supportive question]??"
-
-            The notification must be under 15 words, show concern, and match their current situation.
-            """
-            
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=human_prompt)
-            ]
+            human_prompt = _NOTIFICATION_HUMAN_TEMPLATE.format(
+                name=user_name,
+                situation=conversation_context,
+                summary=summary_text or "No earlier summary available",
+                recent=context_text or "No recent conversation available"
+            )
+            messages = [_NOTIFICATION_SYSTEM_MESSAGE, HumanMessage(content=human_prompt)]
             
             response = llm.invoke(messages)
             notification_text = response.content.strip()
@@ -309,8 +601,6 @@ class MessageManager:
             
             return notification_text
             
-        except Exception as e:
-            logging.error(f"Error generating notification text: {e}")
-            user_profile = firebase_manager.get_user_profile(email)
-            user_name = user_profile.name 
+        except Exception:
+            logger.exception("Error generating notification text")
             return f"Hey {user_name}, Missing you. Are you feeling okay??"
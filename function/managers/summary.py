@@ -3,21 +3,124 @@ Summary Manager for Daily Conversation Summaries
 Handles generation, storage, and retrieval of conversation summaries
 """
 
-from typing import List, Optional
+import threading
+from functools import cached_property
+from typing import Iterable, List, Optional, Set
 import firebase_admin
+from cachetools import TTLCache
 from firebase_admin import firestore
+from google.api_core import exceptions as api_exceptions
+from google.api_core.retry import Retry, if_exception_type
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from data import MessagePair
+from llm import get_chat_model
 import logging
 
 
+# Bound on how much of a day's transcript is sent to the LLM for summarising
+SUMMARY_MAX_LINES = 80
+SUMMARY_HEAD_LINES = 2
+SUMMARY_MAX_CHARS = 8000
+# A single message longer than this is clipped, so the opening exchange, the marker and
+# at least the newest exchange always fit in SUMMARY_MAX_CHARS
+SUMMARY_MAX_LINE_CHARS = 1900
+# Room reserved for the "earlier messages omitted" marker line
+_OMITTED_MARKER_CHARS = 64
+
+# Parallel requests per batched summary call; kept under the Gemini per-minute rate limit
+SUMMARY_BATCH_CONCURRENCY = 16
+
+# Backoff for summary reads and writes when Firestore throttles or is briefly unavailable,
+# so a nightly run over many users backs off instead of failing through quota errors
+_FIRESTORE_RETRY = Retry(
+    predicate=if_exception_type(
+        api_exceptions.ResourceExhausted,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.DeadlineExceeded,
+    ),
+    initial=1.0,
+    maximum=30.0,
+    multiplier=2.0,
+    timeout=120.0,
+)
+
+# Distinguishes "not cached" from a cached None (no summary for that day)
+_NOT_CACHED = object()
+
+# Daily summaries keyed by (email, date_str); shared by every SummaryManager in the worker.
+# A day's summary is written once, so entries only change through store_daily_summary.
+_SUMMARY_CACHE = TTLCache(maxsize=4096, ttl=300)
+_SUMMARY_CACHE_LOCK = threading.Lock()
+
+# Summary prompts are fixed apart from the transcript, so they are built once at import
+_SUMMARY_SYSTEM_MESSAGE = SystemMessage(content="You are a caring friend creating simple conversation summaries to help remember what you talked about with someone. Write in a natural, friendly tone like you're taking notes to remember for next time.")
+
+_SUMMARY_PROMPT_TEMPLATE = """Summarize this conversation between a user and their mental health support friend:
+
+        CONVERSATION:
+        {conversation_text}
+
+        Create a friendly summary that covers:
+        1. What the user talked about and how they were feeling
+        2. Main topics or concerns they shared
+        3. Any positive moments or progress they mentioned
+        4. Important things to remember for next time you chat
+        5. How they seemed to be feeling by the end
+
+        Keep it:
+        - Simple and conversational (like notes a friend would take)
+        - Under 120 words
+        - Focused on what matters for continuing the friendship
+        - Written like "User talked about..." or "They seemed..."
+        - Remember this is for helping continue supportive conversations
+
+        Write a natural summary that helps remember what happened in this chat."""
+
+
+def _clip_line(text: str) -> str:
+    """Shorten one transcript line to SUMMARY_MAX_LINE_CHARS, keeping its start."""
+    if len(text) <= SUMMARY_MAX_LINE_CHARS:
+        return text
+    return text[:SUMMARY_MAX_LINE_CHARS - 4] + " ..."
+
+
+def _trim_transcript(parts: List[str]) -> List[str]:
+    """
+    Fit transcript lines into the line and character budgets by dropping whole exchanges.
+    
+    Lines come in User/Assistant pairs. The opening exchange and the newest exchanges are
+    kept; the dropped middle is replaced by a single marker line giving how many messages
+    were omitted, so the marker always sits on an exchange boundary.
+    """
+    if len(parts) <= SUMMARY_MAX_LINES and sum(len(line) + 1 for line in parts) <= SUMMARY_MAX_CHARS:
+        return parts
+    
+    head = parts[:SUMMARY_HEAD_LINES]
+    char_budget = SUMMARY_MAX_CHARS - _OMITTED_MARKER_CHARS - sum(len(line) + 1 for line in head)
+    tail = []
+    for end in range(len(parts), SUMMARY_HEAD_LINES, -2):
+        exchange = parts[end - 2:end]
+        exchange_chars = sum(len(line) + 1 for line in exchange)
+        if len(tail) + 2 > SUMMARY_MAX_LINES - SUMMARY_HEAD_LINES or exchange_chars > char_budget:
+            break
+        tail[:0] = exchange
+        char_budget -= exchange_chars
+    
+    dropped = len(parts) - len(head) - len(tail)
+    return head + [f"... [{dropped} earlier messages omitted] ..."] + tail
+
+
 class SummaryManager:
     """Manages conversation summaries and daily summary generation."""
     
     def __init__(self, config,db=None):
         """Initialize with optional database connection."""
+        self.config = config
         self.db = db
+        self._user_refs = {}
+        self._summary_cache = _SUMMARY_CACHE
+        self._cache_lock = _SUMMARY_CACHE_LOCK
         if not self.db:
             try:
                 if firebase_admin._apps:
@@ -27,12 +130,22 @@ class SummaryManager:
             except Exception as e:
                 logging.error(f"Could not initialize Firebase in SummaryManager: {e}")
                 self.db = None
-        
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.model_name,
-            google_api_key=config.gemini_api_key,
-            temperature=0.5  
-        )
+
+    def _user_ref(self, email: str):
+        """Return the user's document reference, reusing it across calls on this manager."""
+        user_ref = self._user_refs.get(email)
+        if user_ref is None:
+            user_ref = self._user_refs[email] = self.db.collection('users').document(email)
+        return user_ref
+
+    def _summary_ref(self, email: str, date_str: str):
+        """Return the reference to a user's daily summary document."""
+        return self._user_ref(email).collection('summaries').document(f'daily_{date_str}')
+
+    @cached_property
+    def llm(self) -> ChatGoogleGenerativeAI:
+        """Summary model client, created on first use rather than per SummaryManager."""
+        return get_chat_model(self.config.model_name, self.config.gemini_api_key, temperature=0.5)
 
     def daily_summary_exists(self, email: str, date_str: str) -> bool:
         """Check if a daily summary already exists for the given date."""
@@ -40,21 +153,51 @@ class SummaryManager:
             return False
         
         try:
-            doc_ref = self.db.collection('users').document(email).collection('summaries').document(f'daily_{date_str}')
-            doc = doc_ref.get()
-            return doc.exists
+            return self._fetch_daily_summary(email, date_str) is not None
             
         except Exception as e:
             logging.error(f"Error checking daily summary existence: {e}")
             return False
     
+    def daily_summaries_exist(self, emails: List[str], date_str: str) -> Set[str]:
+        """Return which of the given users already have a daily summary for the date, in one read."""
+        if not self.db or not emails:
+            return set()
+        
+        existing = set()
+        uncached = []
+        for email in emails:
+            cached = self._get_cached_summary(email, date_str)
+            if cached is _NOT_CACHED:
+                uncached.append(email)
+            elif cached is not None:
+                existing.add(email)
+        
+        if not uncached:
+            return existing
+        
+        try:
+            refs = [self._summary_ref(email, date_str) for email in uncached]
+            # get_all fetches every document in a single round trip; results come back unordered
+            for doc in self.db.get_all(refs, retry=_FIRESTORE_RETRY):
+                email = doc.reference.parent.parent.id
+                self._cache_summary(email, date_str, doc.to_dict() if doc.exists else None)
+                if doc.exists:
+                    existing.add(email)
+            return existing
+            
+        except Exception as e:
+            logging.error(f"Error checking daily summary existence: {e}")
+            return existing
+    
     def store_daily_summary(self, email: str, date_str: str, summary: dict):
         """Store a daily conversation summary."""
         if not self.db:
             return
         
         try:
-            self.db.collection('users').document(email).collection('summaries').document(f'daily_{date_str}').set(summary)
+            self._summary_ref(email, date_str).set(summary, retry=_FIRESTORE_RETRY)
+            self._cache_summary(email, date_str, summary)
             logging.info(f"Stored daily summary for {email} on {date_str}")
             
         except Exception as e:
@@ -66,64 +209,44 @@ class SummaryManager:
             return None
         
         try:
-            doc_ref = self.db.collection('users').document(email).collection('summaries').document(f'daily_{date_str}')
-            doc = doc_ref.get()
-            
-            if doc.exists:
-                return doc.to_dict()
-            return None
+            return self._fetch_daily_summary(email, date_str)
             
         except Exception as e:
             logging.error(f"Error getting daily summary: {e}")
             return None
     
-    def generate_conversation_summary(self, message_pairs: List[MessagePair]) -> str:
+    def _fetch_daily_summary(self, email: str, date_str: str) -> Optional[dict]:
+        """Read a day's summary with a single get, serving repeat reads from the cache."""
+        cached = self._get_cached_summary(email, date_str)
+        if cached is not _NOT_CACHED:
+            return cached
+        
+        doc = self._summary_ref(email, date_str).get(retry=_FIRESTORE_RETRY)
+        summary = doc.to_dict() if doc.exists else None
+        self._cache_summary(email, date_str, summary)
+        return summary
+    
+    def _get_cached_summary(self, email: str, date_str: str):
+        """Return the cached summary (possibly None), or _NOT_CACHED if there is no entry."""
+        with self._cache_lock:
+            return self._summary_cache.get((email, date_str), _NOT_CACHED)
+    
+    def _cache_summary(self, email: str, date_str: str, summary: Optional[dict]):
+        """Remember a day's summary, or its absence, for later reads."""
+        with self._cache_lock:
+            self._summary_cache[(email, date_str)] = summary
+    
+    def generate_conversation_summary(self, message_pairs: Iterable[MessagePair]) -> str:
         """Generate AI summary of a conversation using LLM."""
         
         if not message_pairs:
             return "No conversation data available for summary."
 
-        # Build conversation text from MessagePair objects
-        conversation_text = ""
-        
-        for message_pair in message_pairs:
-            if isinstance(message_pair, MessagePair):
-                user_content = message_pair.user_message.content
-                llm_content = message_pair.llm_message.content
-                conversation_text += f"User: {user_content}\n"
-                conversation_text += f"Assistant: {llm_content}\n"
-        
-        if not conversation_text.strip():
+        messages = self._build_summary_messages(message_pairs)
+        if messages is None:
             return None
-        
-        # Generate summary using LLM
-        summary_prompt = f"""Summarize this conversation between a user and their mental health support friend:
-
-        CONVERSATION:
-        {conversation_text}
-
-        Create a friendly summary that covers:
-        1. What the user talked about and how they were feeling
-        2. Main topics or concerns they shared
-        3. Any positive moments or progress they mentioned
-        4. Important things to remember for next time you chat
-        5. How they seemed to be feeling by the end
-
-        Keep it:
-        - Simple and conversational (like notes a friend would take)
-        - Under 120 words
-        - Focused on what matters for continuing the friendship
-        - Written like "User talked about..." or "They seemed..."
-        - Remember this is for helping continue supportive conversations
-
-        Write a natural summary that helps remember what happened in this chat."""
 
         try:
-            messages = [
-                SystemMessage(content="You are a caring friend creating simple conversation summaries to help remember what you talked about with someone. Write in a natural, friendly tone like you're taking notes to remember for next time."),
-                HumanMessage(content=summary_prompt)
-            ]
-            
             response = self.llm.invoke(messages)
             summary_text = response.content.strip()
             
@@ -132,3 +255,64 @@ class SummaryManager:
         except Exception as e:
             logging.warning(f"Could not generate summary: {e}")
             return None
+
+    def generate_conversation_summaries_batch(self, conversations: List[Iterable[MessagePair]]) -> List[Optional[str]]:
+        """
+        Generate summaries for many conversations with one batched LLM call.
+        
+        Returns one entry per conversation, in order; None where the conversation was
+        empty or its summary could not be generated.
+        """
+        summaries: List[Optional[str]] = [None] * len(conversations)
+        indexed_messages = []
+        for index, message_pairs in enumerate(conversations):
+            messages = self._build_summary_messages(message_pairs)
+            if messages is not None:
+                indexed_messages.append((index, messages))
+        
+        if not indexed_messages:
+            return summaries
+        
+        try:
+            responses = self.llm.batch(
+                [messages for _, messages in indexed_messages],
+                config={"max_concurrency": SUMMARY_BATCH_CONCURRENCY},
+                return_exceptions=True
+            )
+        except Exception as e:
+            logging.warning(f"Could not generate summaries: {e}")
+            return summaries
+        
+        for (index, _), response in zip(indexed_messages, responses):
+            if isinstance(response, Exception):
+                logging.warning(f"Could not generate summary: {response}")
+                continue
+            summaries[index] = response.content.strip()
+        
+        return summaries
+
+    def _build_summary_messages(self, message_pairs: Iterable[MessagePair]) -> Optional[list]:
+        """Build the LLM messages for summarising a conversation, or None if it has no content."""
+        # Build conversation text from MessagePair objects
+        parts = []
+        
+        # Pairs come from MessageManager's readers, which only ever yield MessagePair objects
+        for message_pair in message_pairs:
+            user_content = message_pair.user_message.content
+            llm_content = message_pair.llm_message.content
+            # Blank pairs add nothing to the summary, so skip them before any formatting
+            if not (user_content and user_content.strip()) and not (llm_content and llm_content.strip()):
+                continue
+            parts.append(_clip_line(f"User: {user_content}"))
+            parts.append(_clip_line(f"Assistant: {llm_content}"))
+        
+        if not parts:
+            return None
+        
+        # Keep the opening exchange and the most recent lines so cost stays flat on long days
+        conversation_text = "\n".join(_trim_transcript(parts)) + "\n"
+        
+        return [
+            _SUMMARY_SYSTEM_MESSAGE,
+            HumanMessage(content=_SUMMARY_PROMPT_TEMPLATE.format(conversation_text=conversation_text))
+        ]